@@ -16,10 +16,14 @@
 from __future__ import with_statement
 import inspect
 
+import errno
 import os
 import re
+import stat
 import sys
 import warnings
+from collections import OrderedDict
+from operator import attrgetter
 from buildbot.util import safeTranslate
 from buildbot import interfaces
 from buildbot import locks
@@ -28,6 +32,11 @@ from twisted.python import log, failure
 from twisted.internet import defer
 from twisted.application import service
 
+try:
+    import lz4.frame as lz4frame
+except ImportError:
+    lz4frame = None
+
 #Make sure we can load our www module from the master folder
 buildbot_folder = os.path.split(inspect.getfile(inspect.currentframe()))[0] + "../../../"
 buildbot_folder = os.path.realpath(os.path.abspath(buildbot_folder))
@@ -36,8 +45,8 @@ if buildbot_folder not in sys.path:
 
 class ConfigErrors(Exception):
 
-    def __init__(self, errors=[]):
-        self.errors = errors[:]
+    def __init__(self, errors=None):
+        self.errors = list(errors) if errors else []
 
     def __str__(self):
         return "\n".join(self.errors)
@@ -46,7 +55,8 @@ class ConfigErrors(Exception):
         self.errors.append(msg)
 
     def __nonzero__(self):
-        return len(self.errors)
+        return bool(self.errors)
+    __bool__ = __nonzero__
 
 _errors = None
 def error(error):
@@ -55,8 +65,68 @@ def error(error):
     else:
         raise ConfigErrors([error])
 
+# default validation patterns; these are shared by every MasterConfig and
+# only copied when the user overrides one of them (see load_validation)
+_default_validation = dict(
+    branch=re.compile(r'^[\w.+/~-]*$'),
+    revision=re.compile(r'^[ \w\.\-\/]*$'),
+    property_name=re.compile(r'^[\w\.\-\/\~:]*$'),
+    property_value=re.compile(r'^[\w\.\-\/\~:]*$'),
+)
+
+# compiled config files, keyed by (filename, source), so that reconfiguring
+# with an unchanged master.cfg does not parse and compile it again
+_config_code_cache = OrderedDict()
+_config_code_cache_size = 4
+
+def _compileConfig(filename, source):
+    key = (filename, source)
+    code = _config_code_cache.get(key)
+    if code is None:
+        code = compile(source, filename, 'exec')
+        _config_code_cache[key] = code
+        while len(_config_code_cache) > _config_code_cache_size:
+            _config_code_cache.popitem(last=False)
+    return code
+
+class _sysPathEntry(object):
+    """
+    Context manager that appends C{path} to C{sys.path} for the duration of
+    the block, and then restores C{sys.path} to what it was before, dropping
+    anything the block added to it as well.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self.old_sys_path = sys.path[:]
+        sys.path.append(self.path)
+        return self
+
+    def __exit__(self, *exc_info):
+        sys.path[:] = self.old_sys_path
+        return False
+
 class MasterConfig(object):
 
+    __slots__ = (
+        # global
+        'title', 'titleURL', 'buildbotURL', 'changeHorizon', 'cleanUpPeriod',
+        'buildRequestsDays', 'eventHorizon', 'logHorizon', 'buildHorizon',
+        'logCompressionLimit', 'logCompressionMethod', 'logMaxTailSize',
+        'logMaxSize', 'properties', 'mergeRequests', 'codebaseGenerator',
+        'prioritizeBuilders', 'slavePortnum', 'remoteCallTimeout',
+        'multiMaster', 'debugPassword', 'manhole', 'realTimeServer',
+        'analytics_code', 'gzip', 'requireLogin', 'autobahn_push',
+        'lastBuildCacheDays', 'slave_debug_url', 'slaveManagerUrl',
+        # everything else
+        'validation', 'db', 'metrics', 'caches', 'schedulers', 'builders',
+        'slaves', 'change_sources', 'status', 'user_managers', 'revlink',
+        'projects', 'globalFactory',
+        '_sched_builders_cache',
+    )
+
     def __init__(self):
         # local import to avoid circular imports
         from buildbot.process import properties
@@ -95,12 +165,7 @@ class MasterConfig(object):
         # This URL will only be used if no slaveManagerUrl is present in master.cfg
         self.slaveManagerUrl = None
 
-        self.validation = dict(
-            branch=re.compile(r'^[\w.+/~-]*$'),
-            revision=re.compile(r'^[ \w\.\-\/]*$'),
-            property_name=re.compile(r'^[\w\.\-\/\~:]*$'),
-            property_value=re.compile(r'^[\w\.\-\/\~:]*$'),
-        )
+        self.validation = _default_validation
         self.db = dict(
             db_url='sqlite:///state.sqlite',
             db_poll_interval=None,
@@ -120,7 +185,10 @@ class MasterConfig(object):
         self.projects = {}
         self.globalFactory = dict(initialSteps=[], lastSteps=[])
 
-    _known_config_keys = set([
+        # (schedulers, {name: buildernames}); see _schedulerBuilderNames
+        self._sched_builders_cache = None
+
+    _known_config_keys = frozenset([
         "buildbotURL", "buildCacheSize", "builders", "buildHorizon", "caches",
         "change_source", "codebaseGenerator", "changeCacheSize", "changeHorizon",
         'db', "db_poll_interval", "db_url", "debugPassword", "eventHorizon",
@@ -134,21 +202,45 @@ class MasterConfig(object):
         "cleanUpPeriod", "buildRequestsDays", "remoteCallTimeout"
     ])
 
+    # loaders are run in this order, each with the full config dict; several
+    # of them apply defaults or look at more than one key, so they are all
+    # called even if their keys are missing
+    _loaders = (
+        'load_global', 'load_validation', 'load_db', 'load_metrics',
+        'load_caches', 'load_projects', 'load_schedulers',
+        'load_globalFactory', 'load_builders', 'load_slaves',
+        'load_change_sources', 'load_status', 'load_user_managers',
+    )
+
+    # sanity checks run once everything is loaded
+    _checkers = (
+        'check_single_master', 'check_schedulers', 'check_locks',
+        'check_builders', 'check_status', 'check_horizons',
+        'check_slavePortnum',
+    )
+
     @classmethod
     def loadConfig(cls, basedir, filename):
-        if not os.path.isdir(basedir):
+        try:
+            basedir_is_dir = stat.S_ISDIR(os.stat(basedir).st_mode)
+        except OSError:
+            basedir_is_dir = False
+        if not basedir_is_dir:
             raise ConfigErrors([
                 "basedir '%s' does not exist" % (basedir,),
             ])
         filename = os.path.join(basedir, filename)
-        if not os.path.exists(filename):
-            raise ConfigErrors([
-                "configuration file '%s' does not exist" % (filename,),
-            ])
 
+        # a missing file shows up as ENOENT here, so there is no need to
+        # stat it first
         try:
-            f = open(filename, "r")
+            with open(filename, "r") as f:
+                source = f.read()
         except IOError, e:
+            if e.errno == errno.ENOENT:
+                raise ConfigErrors([
+                    "configuration file '%s' does not exist" % (filename,),
+                ])
             raise ConfigErrors([
                 "unable to open configuration file %r: %s" % (filename, e),
             ])
@@ -166,24 +258,22 @@ class MasterConfig(object):
         global _errors
         _errors = errors = ConfigErrors()
 
-        old_sys_path = sys.path[:]
-        sys.path.append(basedir)
         try:
-            try:
-                exec f in localDict
-            except ConfigErrors, e:
-                for err in e.errors:
-                    error(err)
-                raise errors
-            except:
-                log.err(failure.Failure(), 'error while parsing config file:')
-                error("error while parsing config file: %s (traceback in logfile)" %
-                        (sys.exc_info()[1],),
-                )
-                raise errors
+            with _sysPathEntry(basedir):
+                exec _compileConfig(filename, source) in localDict
+        except ConfigErrors, e:
+            for err in e.errors:
+                error(err)
+            raise errors
+        except (Exception, SystemExit):
+            # a master.cfg that calls sys.exit() is a broken config, not a
+            # request to stop the master
+            log.err(failure.Failure(), 'error while parsing config file:')
+            error("error while parsing config file: %s (traceback in logfile)" %
+                    (sys.exc_info()[1],),
+            )
+            raise errors
         finally:
-            f.close()
-            sys.path[:] = old_sys_path
             _errors = None
 
         if 'BuildmasterConfig' not in localDict:
@@ -194,7 +284,7 @@ class MasterConfig(object):
         config_dict = localDict['BuildmasterConfig']
 
         # check for unknown keys
-        unknown_keys = set(config_dict.keys()) - cls._known_config_keys
+        unknown_keys = config_dict.viewkeys() - cls._known_config_keys
         if unknown_keys:
             if len(unknown_keys) == 1:
                 error('Unknown BuildmasterConfig key %s' %
@@ -210,28 +300,12 @@ class MasterConfig(object):
         _errors = errors
         # and defer the rest to sub-functions, for code clarity
         try:
-            config.load_global(filename, config_dict)
-            config.load_validation(filename, config_dict)
-            config.load_db(filename, config_dict)
-            config.load_metrics(filename, config_dict)
-            config.load_caches(filename, config_dict)
-            config.load_projects(filename, config_dict)
-            config.load_schedulers(filename, config_dict)
-            config.load_globalFactory(filename, config_dict)
-            config.load_builders(filename, config_dict)
-            config.load_slaves(filename, config_dict)
-            config.load_change_sources(filename, config_dict)
-            config.load_status(filename, config_dict)
-            config.load_user_managers(filename, config_dict)
+            for loader in cls._loaders:
+                getattr(config, loader)(filename, config_dict)
 
             # run some sanity checks
-            config.check_single_master()
-            config.check_schedulers()
-            config.check_locks()
-            config.check_builders()
-            config.check_status()
-            config.check_horizons()
-            config.check_slavePortnum()
+            for checker in cls._checkers:
+                getattr(config, checker)()
         finally:
             _errors = None
 
@@ -240,60 +314,68 @@ class MasterConfig(object):
 
         return config
 
-    def load_global(self, filename, config_dict):
-        def copy_param(name, alt_key=None,
-                       check_type=None, check_type_name=None):
-            if name in config_dict:
-                v = config_dict[name]
-            elif alt_key and alt_key in config_dict:
-                v = config_dict[alt_key]
-            else:
-                return
-            if v is not None and check_type and not isinstance(v, check_type):
-                error("c['%s'] must be %s" %
-                                (name, check_type_name))
-            else:
-                setattr(self, name, v)
-
-        def copy_int_param(name, alt_key=None):
-            copy_param(name, alt_key=alt_key,
-                    check_type=int, check_type_name='an int')
+    # (name, alt_key) pairs copied verbatim by load_global, grouped by the
+    # type they must have
+    _global_str_params = (
+        ('title', 'projectName'),
+        ('titleURL', 'projectURL'),
+        ('buildbotURL', None),
+        ('realTimeServer', None),
+        ('analytics_code', None),
+        ('slave_debug_url', None),
+        ('slaveManagerUrl', None),
+        ('debugPassword', None),
+    )
+    _global_int_params = (
+        ('cleanUpPeriod', None),
+        ('changeHorizon', None),
+        ('buildRequestsDays', None),
+        ('eventHorizon', None),
+        ('logHorizon', None),
+        ('buildHorizon', None),
+        ('lastBuildCacheDays', None),
+        ('logCompressionLimit', None),
+        ('logMaxSize', None),
+        ('logMaxTailSize', None),
+        ('remoteCallTimeout', None),
+    )
 
-        def copy_str_param(name, alt_key=None):
-            copy_param(name, alt_key=alt_key,
-                    check_type=basestring, check_type_name='a string')
-
-        copy_str_param('title', alt_key='projectName')
-        copy_str_param('titleURL', alt_key='projectURL')
-
-        copy_str_param('buildbotURL')
-
-        # Make sure that buildbotURL ends with a forward slash
-        if not self.buildbotURL.endswith('/'):
-            self.buildbotURL += '/'
-
-        copy_str_param('realTimeServer')
-        copy_str_param('analytics_code')
-
-        copy_int_param('cleanUpPeriod')
-        copy_int_param('changeHorizon')
-        copy_int_param('buildRequestsDays')
-        copy_int_param('eventHorizon')
-        copy_int_param('logHorizon')
-        copy_int_param('buildHorizon')
-        copy_int_param('lastBuildCacheDays')
+    def load_global(self, filename, config_dict):
+        for params, check_type, check_type_name in (
+                (self._global_str_params, basestring, 'a string'),
+                (self._global_int_params, int, 'an int')):
+            for name, alt_key in params:
+                if name in config_dict:
+                    v = config_dict[name]
+                elif alt_key and alt_key in config_dict:
+                    v = config_dict[alt_key]
+                else:
+                    continue
+                if v is not None and not isinstance(v, check_type):
+                    error("c['%s'] must be %s" % (name, check_type_name))
+                else:
+                    setattr(self, name, v)
+
+        # Make sure that buildbotURL ends with a forward slash; it is used to
+        # build every web status URL, so keep a single interned copy
+        buildbotURL = self.buildbotURL
+        if not buildbotURL.endswith('/'):
+            buildbotURL += '/'
+        if isinstance(buildbotURL, str):
+            buildbotURL = intern(buildbotURL)
+        self.buildbotURL = buildbotURL
 
-        copy_int_param('logCompressionLimit')
+        if not self.slaveManagerUrl:
+            self.slaveManagerUrl = "No Slave Manager URL Configured"
 
         if 'logCompressionMethod' in config_dict:
             logCompressionMethod = config_dict.get('logCompressionMethod')
-            if logCompressionMethod not in ('bz2', 'gz'):
-                error("c['logCompressionMethod'] must be 'bz2' or 'gz'")
+            if logCompressionMethod not in ('bz2', 'gz', 'lz4'):
+                error("c['logCompressionMethod'] must be 'bz2', 'gz' or 'lz4'")
+            elif logCompressionMethod == 'lz4' and not lz4frame:
+                error("c['logCompressionMethod'] 'lz4' requires the lz4 package")
             self.logCompressionMethod = logCompressionMethod
 
-        copy_int_param('logMaxSize')
-        copy_int_param('logMaxTailSize')
-
         properties = config_dict.get('properties', {})
         if not isinstance(properties, dict):
             error("c['properties'] must be a dictionary")
@@ -327,8 +409,6 @@ class MasterConfig(object):
                 slavePortnum = "tcp:%d" % slavePortnum
             self.slavePortnum = slavePortnum
 
-        copy_int_param('remoteCallTimeout')
-
         if 'multiMaster' in config_dict:
             self.multiMaster = config_dict["multiMaster"]
 
@@ -341,14 +421,6 @@ class MasterConfig(object):
         if 'autobahn_push' in config_dict:
             self.autobahn_push = "true" if config_dict["autobahn_push"] else "false"
 
-        copy_str_param("slave_debug_url")
-
-        copy_str_param("slaveManagerUrl")
-        if not self.slaveManagerUrl:
-            self.slaveManagerUrl = "No Slave Manager URL Configured"
-
-        copy_str_param('debugPassword')
-
         if 'manhole' in config_dict:
             # we don't check that this is a manhole instance, since that
             # requires importing buildbot.manhole for every user, and currently
@@ -372,14 +444,16 @@ class MasterConfig(object):
             if unknown_keys:
                 error("unrecognized validation key(s): %s" %
                                     (", ".join(unknown_keys)))
-            else:
+            elif validation:
+                # copy-on-write, so the shared defaults are never modified
+                self.validation = dict(self.validation)
                 self.validation.update(validation)
 
 
     def load_db(self, filename, config_dict):
         if 'db' in config_dict:
             db = config_dict['db']
-            if set(db.keys()) > set(['db_url', 'db_poll_interval']):
+            if set(db) > {'db_url', 'db_poll_interval'}:
                 error("unrecognized keys in c['db']")
             self.db.update(db)
         if 'db_url' in config_dict:
@@ -451,7 +525,7 @@ class MasterConfig(object):
                                 p.name)
             seen_names.add(p.name)
 
-        self.projects =  dict((p.name, p) for p in projects)
+        self.projects = {p.name: p for p in projects}
 
 
     def load_schedulers(self, filename, config_dict):
@@ -459,13 +533,8 @@ class MasterConfig(object):
             return
         schedulers = config_dict['schedulers']
 
-        ok = True
-        if not isinstance(schedulers, (list, tuple)):
-            ok = False
-        else:
-            for s in schedulers:
-                if not interfaces.IScheduler.providedBy(s):
-                    ok = False
+        ok = (isinstance(schedulers, (list, tuple)) and
+              all(interfaces.IScheduler.providedBy(s) for s in schedulers))
         if not ok:
             msg="c['schedulers'] must be a list of Scheduler instances"
             error(msg)
@@ -479,13 +548,13 @@ class MasterConfig(object):
             seen_names.add(s.name)
 
 
-        self.schedulers = dict((s.name, s) for s in schedulers)
+        self.schedulers = {s.name: s for s in schedulers}
 
 
     def load_globalFactory(self, filename, config_dict):
         if 'globalFactory' in config_dict:
             globalFactory = config_dict['globalFactory']
-            if set(globalFactory.keys()) - set(['initialSteps', 'lastSteps']):
+            if set(globalFactory) - {'initialSteps', 'lastSteps'}:
                 error("unrecognized keys in c['globalFactory']")
             self.globalFactory.update(globalFactory)
 
@@ -509,11 +578,12 @@ class MasterConfig(object):
                 error("%r is not a builder config (in c['builders']" % (b,))
         builders = [ mapper(b) for b in builders ]
 
-        for builder in builders:
-            if builder and os.path.isabs(builder.builddir):
-                warnings.warn("Absolute path '%s' for builder may cause "
-                        "mayhem.  Perhaps you meant to specify slavebuilddir "
-                        "instead.")
+        abs_builddirs = [ b.builddir for b in builders
+                          if b and os.path.isabs(b.builddir) ]
+        if abs_builddirs:
+            warnings.warn("Absolute path(s) %s for builder may cause "
+                    "mayhem.  Perhaps you meant to specify slavebuilddir "
+                    "instead." % (', '.join(map(repr, abs_builddirs)),))
 
         self.builders = builders
 
@@ -527,12 +597,12 @@ class MasterConfig(object):
             error("c['slaves'] must be a list")
             return
 
-        for sl in slaves:
-            if not interfaces.IBuildSlave.providedBy(sl):
-                msg = "c['slaves'] must be a list of BuildSlave instances"
-                error(msg)
-                return
+        if not all(interfaces.IBuildSlave.providedBy(sl) for sl in slaves):
+            msg = "c['slaves'] must be a list of BuildSlave instances"
+            error(msg)
+            return
 
+        for sl in slaves:
             if sl.slavename in ("debug", "change", "status"):
                 msg = "slave name '%s' is reserved" % sl.slavename
                 error(msg)
@@ -547,11 +617,11 @@ class MasterConfig(object):
         else:
             change_sources = [change_source]
 
-        for s in change_sources:
-            if not interfaces.IChangeSource.providedBy(s):
-                msg = "c['change_source'] must be a list of change sources"
-                error(msg)
-                return
+        if not all(interfaces.IChangeSource.providedBy(s)
+                   for s in change_sources):
+            msg = "c['change_source'] must be a list of change sources"
+            error(msg)
+            return
 
         self.change_sources = change_sources
 
@@ -565,10 +635,9 @@ class MasterConfig(object):
             error(msg)
             return
 
-        for s in status:
-            if not interfaces.IStatusReceiver.providedBy(s):
-                error(msg)
-                return
+        if not all(interfaces.IStatusReceiver.providedBy(s) for s in status):
+            error(msg)
+            return
 
         self.status = status
 
@@ -586,6 +655,16 @@ class MasterConfig(object):
         self.user_managers = user_managers
 
 
+    def _schedulerBuilderNames(self):
+        # several checks need the builder names of every scheduler, so only
+        # ask the schedulers once for a given schedulers dict
+        cache = self._sched_builders_cache
+        if cache is None or cache[0] is not self.schedulers:
+            names = {name: tuple(s.listBuilderNames())
+                     for name, s in self.schedulers.iteritems()}
+            cache = self._sched_builders_cache = (self.schedulers, names)
+        return cache[1]
+
     def check_single_master(self):
         # check additional problems that are only valid in a single-master
         # installation
@@ -602,56 +681,56 @@ class MasterConfig(object):
             error("no projects are configured")
 
         # check that all builders are implemented on this master
-        unscheduled_buildernames = set([ b.name for b in self.builders ])
-        for s in self.schedulers.itervalues():
-            for n in s.listBuilderNames():
-                if n in unscheduled_buildernames:
-                    unscheduled_buildernames.remove(n)
+        scheduled_buildernames = set().union(
+                *self._schedulerBuilderNames().itervalues())
+        unscheduled_buildernames = (
+                {b.name for b in self.builders} - scheduled_buildernames)
         if unscheduled_buildernames:
             error("builder(s) %s have no schedulers to drive them"
                             % (', '.join(unscheduled_buildernames),))
 
 
     def check_schedulers(self):
-        all_buildernames = set([ b.name for b in self.builders ])
+        all_buildernames = {b.name for b in self.builders}
 
-        for s in self.schedulers.itervalues():
-            for n in s.listBuilderNames():
+        for name, buildernames in self._schedulerBuilderNames().iteritems():
+            for n in buildernames:
                 if n not in all_buildernames:
                     error("Unknown builder '%s' in scheduler '%s'"
-                                    % (n, s.name))
+                                    % (n, name))
 
 
     def check_locks(self):
         # assert that all locks used by the Builds and their Steps are
         # uniquely named.
         lock_dict = {}
-        def check_lock(l):
-            if isinstance(l, locks.LockAccess):
-                l = l.lockid
-            if lock_dict.has_key(l.name):
-                if lock_dict[l.name] is not l:
-                    msg = "Two locks share the same name, '%s'" % l.name
-                    error(msg)
-            else:
-                lock_dict[l.name] = l
-
         for b in self.builders:
             if b.locks:
                 for l in b.locks:
-                    check_lock(l)
+                    self._check_lock(l, lock_dict)
+
+    def _check_lock(self, l, lock_dict):
+        if isinstance(l, locks.LockAccess):
+            l = l.lockid
+        if l.name in lock_dict:
+            if lock_dict[l.name] is not l:
+                msg = "Two locks share the same name, '%s'" % l.name
+                error(msg)
+        else:
+            lock_dict[l.name] = l
 
     def checkUnknownSlave(self, builder, builder_slavenames, slavenames):
         if builder_slavenames:
-            unknowns = set(builder_slavenames) - slavenames
+            unknowns = [ sn for sn in builder_slavenames
+                         if sn not in slavenames ]
             if unknowns:
                 error("builder '%s' uses unknown slaves %s" %
-                      (builder.name, ", ".join(`u` for u in unknowns)))
+                      (builder.name, ", ".join(map(repr, unknowns))))
 
     def check_builders(self):
         # look both for duplicate builder names, and for builders pointing
         # to unknown slaves
-        slavenames = set([ s.slavename for s in self.slaves ])
+        slavenames = {s.slavename for s in self.slaves}
         seen_names = set()
         seen_builddirs = set()
 
@@ -659,7 +738,7 @@ class MasterConfig(object):
             self.checkUnknownSlave(b, b.slavenames, slavenames)
             self.checkUnknownSlave(b, b.startSlavenames, slavenames)
 
-            if not self.projects or (b.project not in self.projects.keys()):
+            if b.project not in self.projects:
                 error("builder '%s' uses unknown project '%s'" % (b.name, b.project))
             if b.name in seen_names:
                 error("duplicate builder name '%s'" % b.name)
@@ -691,26 +770,30 @@ class MasterConfig(object):
         if self.debugPassword:
             error("debug client is configured, but no slavePortnum is set")
 
-class ProjectConfig:
+class ProjectConfig(object):
 
-    def __init__(self, name=None, codebases=[], priority=sys.maxint):
-        self.name = name
-        self.codebases = codebases
-        self.priority = priority
-
-        errors = ConfigErrors([])
+    __slots__ = ('name', 'codebases', 'priority')
 
+    def __init__(self, name=None, codebases=[], priority=sys.maxint):
         if not name or not isinstance(name, basestring):
             error("project's name is required")
             name = '<unknown>'
         self.name = name
-        if errors:
-            raise errors
+        self.codebases = codebases
+        self.priority = priority
 
     def asDict(self):
         return {"name" : self.name}
 
-class BuilderConfig:
+class BuilderConfig(object):
+
+    __slots__ = (
+        'name', 'friendly_name', 'factory', 'slavenames', 'startSlavenames',
+        'excludeGlobalFactory', 'builddir', 'slavebuilddir', 'category',
+        'nextSlave', 'nextBuild', 'canStartBuild', 'locks', 'env',
+        'properties', 'mergeRequests', 'project', 'tags', 'description',
+        'customBuildUrls',
+    )
 
     def __init__(self, name=None, slavename=None, startSlavenames=None, slavenames=None,
             builddir=None, slavebuilddir=None, factory=None, category=None,
@@ -738,24 +821,25 @@ class BuilderConfig:
         # factory is required
         if factory is None:
             error("builder '%s' has no factory" % name)
-        from buildbot.process.factory import BuildFactory
-        if factory is not None and not isinstance(factory, BuildFactory):
-            error("builder '%s's factory is not a BuildFactory instance" % name)
+        else:
+            from buildbot.process.factory import BuildFactory
+            if not isinstance(factory, BuildFactory):
+                error("builder '%s's factory is not a BuildFactory instance"
+                        % name)
         self.factory = factory
 
         # slavenames can be a single slave name or a list, and should also
         # include slavename, if given
-        if type(slavenames) is str:
+        if isinstance(slavenames, basestring):
             slavenames = [ slavenames ]
-        if slavenames:
-            if not isinstance(slavenames, list):
-                error("builder '%s': slavenames must be a list or a string" %
-                        (name,))
-        else:
+        elif not slavenames:
             slavenames = []
+        elif not isinstance(slavenames, list):
+            error("builder '%s': slavenames must be a list or a string" %
+                    (name,))
 
         if slavename:
-            if type(slavename) != str:
+            if not isinstance(slavename, basestring):
                 error("builder '%s': slavename must be a string" % (name,))
             slavenames = slavenames + [ slavename ]
         if not slavenames:
@@ -826,12 +910,9 @@ class BuilderConfig:
         """
         Validates that customBuildUrls is a dictionary containing only strings and in the format {'name': 'url'}
         """
-        def checkDictionaryContainsOnlyString():
-            return all(isinstance(key, str) and isinstance(value, str)
-                       for key, value in self.customBuildUrls.iteritems())
-
-        if not isinstance(self.customBuildUrls, dict) or (
-            self.customBuildUrls and not checkDictionaryContainsOnlyString()):
+        urls = self.customBuildUrls
+        if not isinstance(urls, dict) or not all(isinstance(key, str) and isinstance(value, str)
+                                                 for key, value in urls.items()):
             error("customBuildUrls must be a a dictionary containing only strings and in the format {'name': 'url'}")
 
     def getCustomBuildUrls(self, buildbotUrl, buildNumber, buildUrl):
@@ -843,17 +924,12 @@ class BuilderConfig:
         :type buildbotUrl: str
         :return: customBuildUrls in the format [{'name': name, 'url': ur}]
         """
-        customBuildUrls = []
-        for key, value in self.customBuildUrls.iteritems():
-            customBuildUrls.append({
-                'name': key,
-                'url': value.format(
-                        buildbotUrl=buildbotUrl,
-                        builderName=self.name,
-                        buildNumber=buildNumber,
-                        buildUrl=buildUrl)
-            })
-        return customBuildUrls
+        fields = dict(buildbotUrl=buildbotUrl,
+                      builderName=self.name,
+                      buildNumber=buildNumber,
+                      buildUrl=buildUrl)
+        return [{'name': key, 'url': value.format(**fields)}
+                for key, value in self.customBuildUrls.items()]
 
     def getConfigDict(self):
         # note: this method will disappear eventually - put your smarts in the
@@ -901,8 +977,9 @@ class ReconfigurableServiceMixin:
                 for svc in self
                 if isinstance(svc, ReconfigurableServiceMixin) ]
 
-        # sort by priority
-        reconfigurable_services.sort(key=lambda svc : -svc.reconfig_priority)
+        # sort by priority, highest first (the sort is stable, so services
+        # with the same priority keep their order)
+        reconfigurable_services.sort(key=attrgetter('reconfig_priority'), reverse=True)
 
         for svc in reconfigurable_services:
             yield svc.reconfigService(new_config)
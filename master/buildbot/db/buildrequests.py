@@ -457,24 +457,35 @@ class BuildRequestsConnectorComponent(base.DBConnectorComponent):
 
             return stmt3
 
+    def _selectPreviousSuccessfulBuildRequest(self, buildername, sourcestamps):
+        sourcestampsets_tbl = self.db.model.sourcestampsets
+        sourcestamps_tbl = self.db.model.sourcestamps
+        buildrequests_tbl = self.db.model.buildrequests
+        buildsets_tbl = self.db.model.buildsets
+
+        stmt = self.selectBuildSetsExactlyMatchesSourcestamps(sourcestamps=sourcestamps,
+                                                              sourcestamps_tbl=sourcestamps_tbl,
+                                                              sourcestampsets_tbl=sourcestampsets_tbl,
+                                                              buildsets_tbl=buildsets_tbl)
+
+        return sa.select(columns=[sa.func.max(buildrequests_tbl.c.id).label("id")]) \
+            .where(buildrequests_tbl.c.buildsetid.in_(stmt)) \
+            .where(buildrequests_tbl.c.complete == 1) \
+            .where(buildrequests_tbl.c.results == 0) \
+            .where(buildrequests_tbl.c.buildername == buildername) \
+            .where(buildrequests_tbl.c.artifactbrid == None)
+
+    def _previousBrdictFromRow(self, row):
+        return dict(brid=row.id, buildsetid=row.buildsetid,
+                    buildername=row.buildername, priority=row.priority,
+                    complete=bool(row.complete), results=row.results,
+                    submitted_at=mkdt(row.submitted_at), complete_at=mkdt(row.complete_at),
+                    artifactbrid=row.artifactbrid)
+
     def getBuildRequestBySourcestamps(self, buildername=None, sourcestamps=None):
         def thd(conn):
-            sourcestampsets_tbl = self.db.model.sourcestampsets
-            sourcestamps_tbl = self.db.model.sourcestamps
             buildrequests_tbl = self.db.model.buildrequests
-            buildsets_tbl = self.db.model.buildsets
-
-            stmt = self.selectBuildSetsExactlyMatchesSourcestamps(sourcestamps=sourcestamps,
-                                                                  sourcestamps_tbl=sourcestamps_tbl,
-                                                                  sourcestampsets_tbl=sourcestampsets_tbl,
-                                                                  buildsets_tbl=buildsets_tbl)
-
-            last_br = sa.select(columns=[sa.func.max(buildrequests_tbl.c.id).label("id")]) \
-                .where(buildrequests_tbl.c.buildsetid.in_(stmt)) \
-                .where(buildrequests_tbl.c.complete == 1) \
-                .where(buildrequests_tbl.c.results == 0) \
-                .where(buildrequests_tbl.c.buildername == buildername) \
-                .where(buildrequests_tbl.c.artifactbrid == None)
+            last_br = self._selectPreviousSuccessfulBuildRequest(buildername, sourcestamps)
 
             q = sa.select(columns=[buildrequests_tbl]) \
                 .where(buildrequests_tbl.c.id == last_br)
@@ -483,18 +494,43 @@ class BuildRequestsConnectorComponent(base.DBConnectorComponent):
             row = res.fetchone()
             buildrequest = None
             if row:
-                submitted_at = mkdt(row.submitted_at)
-                complete_at = mkdt(row.complete_at)
-                buildrequest = dict(brid=row.id, buildsetid=row.buildsetid,
-                                    buildername=row.buildername, priority=row.priority,
-                                    complete=bool(row.complete), results=row.results,
-                                    submitted_at=submitted_at, complete_at=complete_at, artifactbrid=row.artifactbrid)
+                buildrequest = self._previousBrdictFromRow(row)
 
             res.close()
             return buildrequest
 
         return self.db.pool.do(thd)
 
+    def getBuildRequestAndBuildsBySourcestamps(self, buildername=None, sourcestamps=None):
+        def thd(conn):
+            buildrequests_tbl = self.db.model.buildrequests
+            builds_tbl = self.db.model.builds
+            last_br = self._selectPreviousSuccessfulBuildRequest(buildername, sourcestamps)
+
+            # fetch the build request and all of its builds in one round trip
+            q = sa.select(columns=[buildrequests_tbl, builds_tbl.c.id.label("bid"),
+                                   builds_tbl.c.number, builds_tbl.c.start_time,
+                                   builds_tbl.c.finish_time],
+                          from_obj=buildrequests_tbl.outerjoin(builds_tbl,
+                                                               (buildrequests_tbl.c.id == builds_tbl.c.brid))) \
+                .where(buildrequests_tbl.c.id == last_br) \
+                .order_by(builds_tbl.c.id)
+
+            res = conn.execute(q)
+            rows = res.fetchall()
+            res.close()
+
+            if not rows:
+                return None, []
+
+            buildrequest = self._previousBrdictFromRow(rows[0])
+            builds = [dict(bid=row.bid, brid=row.id, number=row.number,
+                           start_time=mkdt(row.start_time), finish_time=mkdt(row.finish_time))
+                      for row in rows if row.bid is not None]
+            return buildrequest, builds
+
+        return self.db.pool.do(thd)
+
     def reusePreviousBuild(self, requests, artifactbrid):
         def thd(conn):
             buildrequests_tbl = self.db.model.buildrequests
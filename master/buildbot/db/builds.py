@@ -22,39 +22,51 @@ from buildbot.db.buildrequests import maybeFilterBuildRequestsBySourceStamps
 class BuildsConnectorComponent(base.DBConnectorComponent):
     # Documentation is in developer/database.rst
 
+    # the statements for the single-build and per-request lookups only differ
+    # in their id, so they are built once, on first use, with a bound
+    # parameter for it
+    _getBuildStmt = None
+    _getBuildsAndResultForRequestStmt = None
+    _getBuildsForRequestStmt = None
+
     def getBuild(self, bid):
         def thd(conn):
-            tbl = self.db.model.builds
-            res = conn.execute(tbl.select(whereclause=(tbl.c.id == bid)))
+            if self._getBuildStmt is None:
+                tbl = self.db.model.builds
+                self._getBuildStmt = tbl.select(whereclause=(tbl.c.id == sa.bindparam('bid')))
+            res = conn.execute(self._getBuildStmt, bid=bid)
             row = res.fetchone()
 
             rv = None
             if row:
-                rv = self._bdictFromRow(row)
+                rv = self._bdictFromRow(row, has_results=False)
             res.close()
             return rv
         return self.db.pool.do(thd)
 
     def getBuildsAndResultForRequest(self, brid):
         def thd(conn):
-            builds_tbl = self.db.model.builds
-            buildrequest_tbl = self.db.model.buildrequests
-            q = sa.select([builds_tbl.c.id, builds_tbl.c.number, buildrequest_tbl.c.id.label("brid"), builds_tbl.c.start_time,
-                                   builds_tbl.c.finish_time, buildrequest_tbl.c.results],
-                                  from_obj= buildrequest_tbl.outerjoin(builds_tbl,
-                                                        (buildrequest_tbl.c.id == builds_tbl.c.brid)),
-                                  whereclause=(buildrequest_tbl.c.id == brid))
-            res = conn.execute(q)
-            return [ self._bdictFromRow(row)
+            if self._getBuildsAndResultForRequestStmt is None:
+                builds_tbl = self.db.model.builds
+                buildrequest_tbl = self.db.model.buildrequests
+                self._getBuildsAndResultForRequestStmt = sa.select([builds_tbl.c.id, builds_tbl.c.number, buildrequest_tbl.c.id.label("brid"), builds_tbl.c.start_time,
+                                       builds_tbl.c.finish_time, buildrequest_tbl.c.results],
+                                      from_obj= buildrequest_tbl.outerjoin(builds_tbl,
+                                                            (buildrequest_tbl.c.id == builds_tbl.c.brid)),
+                                      whereclause=(buildrequest_tbl.c.id == sa.bindparam('brid')))
+            res = conn.execute(self._getBuildsAndResultForRequestStmt, brid=brid)
+            return [ self._bdictFromRow(row, has_results=True)
                      for row in res.fetchall() ]
         return self.db.pool.do(thd)
 
     def getBuildsForRequest(self, brid):
         def thd(conn):
-            tbl = self.db.model.builds
-            q = tbl.select(whereclause=(tbl.c.brid == brid))
-            res = conn.execute(q)
-            return [ self._bdictFromRow(row) for row in res.fetchall() ]
+            if self._getBuildsForRequestStmt is None:
+                tbl = self.db.model.builds
+                self._getBuildsForRequestStmt = tbl.select(whereclause=(tbl.c.brid == sa.bindparam('brid')))
+            res = conn.execute(self._getBuildsForRequestStmt, brid=brid)
+            return [ self._bdictFromRow(row, has_results=False)
+                     for row in res.fetchall() ]
         return self.db.pool.do(thd)
 
     def getBuildNumberForRequest(self, brid):
@@ -97,16 +109,20 @@ class BuildsConnectorComponent(base.DBConnectorComponent):
     def finishBuilds(self, bids, _reactor=reactor):
         def thd(conn):
             transaction = conn.begin()
-            tbl = self.db.model.builds
-            now = _reactor.seconds()
-
-            # split the bids into batches, so as not to overflow the parameter
-            # lists of the database interface
-            remaining = bids
-            while remaining:
-                batch, remaining = remaining[:100], remaining[100:]
-                q = tbl.update(whereclause=(tbl.c.id.in_(batch)))
-                conn.execute(q, finish_time=now)
+            try:
+                tbl = self.db.model.builds
+                now = _reactor.seconds()
+
+                # split the bids into batches, so as not to overflow the
+                # parameter lists of the database interface
+                remaining = bids
+                while remaining:
+                    batch, remaining = remaining[:100], remaining[100:]
+                    q = tbl.update(whereclause=(tbl.c.id.in_(batch)))
+                    conn.execute(q, finish_time=now)
+            except:
+                transaction.rollback()
+                raise
 
             transaction.commit()
         return self.db.pool.do(thd)
@@ -242,17 +258,21 @@ class BuildsConnectorComponent(base.DBConnectorComponent):
 
         return self.db.pool.do(thd)
 
-    def _bdictFromRow(self, row):
-        def mkdt(epoch):
-            if epoch:
-                return epoch2datetime(epoch)
+    def _bdictFromRow(self, row, has_results=None):
+        # callers building many bdicts from one query already know whether
+        # it selects a results column, and pass has_results to save looking
+        # at the keys of every row
+        if has_results is None:
+            has_results = 'results' in row.keys()
 
+        start_time = row.start_time
+        finish_time = row.finish_time
         _bdict = dict(
             bid=row.id,
             brid=row.brid,
             number=row.number,
-            start_time=mkdt(row.start_time),
-            finish_time=mkdt(row.finish_time))
-        if 'results' in row.keys():
+            start_time=epoch2datetime(start_time) if start_time else None,
+            finish_time=epoch2datetime(finish_time) if finish_time else None)
+        if has_results:
             _bdict['results'] = row.results
         return _bdict
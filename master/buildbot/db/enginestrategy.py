@@ -108,6 +108,12 @@ class BuildbotEngineStrategy(strategies.ThreadLocalEngineStrategy):
 
         kwargs['pool_recycle'] = int(u.query.pop('max_idle', 3600))
 
+        # let operators size the connection pool (and with it, the DB thread
+        # pool) from the URL
+        for arg in ('pool_size', 'max_overflow'):
+            if arg in u.query:
+                kwargs[arg] = int(u.query.pop(arg))
+
         # default to the InnoDB storage engine
         storage_engine = u.query.pop('default_storage_engine', 'InnoDB')
         kwargs['connect_args'] = {
@@ -801,6 +801,11 @@ class IStatusLog(Interface):
         trailing newline).
         """
 
+    def iterlines():
+        """Like readlines(), but generate the stdout lines one at a time
+        without reading the whole logfile into memory first.
+        """
+
     def getTextWithHeaders():
         """Return one big string with the contents of the Log. This merges
         all chunks (including headers) together."""
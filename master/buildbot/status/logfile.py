@@ -18,6 +18,11 @@ from cStringIO import StringIO
 from bz2 import BZ2File
 from gzip import GzipFile
 
+try:
+    import lz4.frame as lz4frame
+except ImportError:
+    lz4frame = None
+
 from zope.interface import implements
 from twisted.python import log, runtime
 from twisted.internet import defer, threads, reactor
@@ -265,6 +270,7 @@ class LogFile:
         """
         return os.path.exists(self.getFilename() + '.bz2') or \
             os.path.exists(self.getFilename() + '.gz') or \
+            os.path.exists(self.getFilename() + '.lz4') or \
             os.path.exists(self.getFilename())
 
     def getName(self):
@@ -328,6 +334,11 @@ class LogFile:
             return GzipFile(self.getFilename() + ".gz", "r")
         except IOError:
             pass
+        if lz4frame:
+            try:
+                return lz4frame.open(self.getFilename() + ".lz4", "rb")
+            except IOError:
+                pass
         return open(self.getFilename(), "r")
 
     def getText(self):
@@ -412,6 +423,28 @@ class LogFile:
         io = StringIO(alltext)
         return io.readlines()
 
+    def iterlines(self):
+        """Like readlines, but generate the lines one at a time while the log
+        is being read, instead of reading all of it into memory first."""
+        # the pieces of a line that spans several chunks are only joined once
+        # its newline arrives, so each byte is copied a bounded number of times
+        partial = []
+        for text in self.getChunks([STDOUT], onlyText=True):
+            first = text.find("\n")
+            if first == -1:
+                partial.append(text)
+                continue
+            partial.append(text[:first + 1])
+            yield "".join(partial)
+            last = text.rfind("\n")
+            if last > first:
+                for line in text[first + 1:last].split("\n"):
+                    yield line + "\n"
+            partial = [text[last + 1:]]
+        rest = "".join(partial)
+        if rest:
+            yield rest
+
     def subscribe(self, receiver, catchup):
         if self.finished:
             return
@@ -592,6 +625,8 @@ class LogFile:
             compressed = self.getFilename() + ".bz2.tmp"
         elif logCompressionMethod == "gz":
             compressed = self.getFilename() + ".gz.tmp"
+        elif logCompressionMethod == "lz4" and lz4frame:
+            compressed = self.getFilename() + ".lz4.tmp"
         else:
             return defer.succeed(None)
 
@@ -601,6 +636,8 @@ class LogFile:
                 cf = BZ2File(compressed, 'w')
             elif logCompressionMethod == "gz":
                 cf = GzipFile(compressed, 'w')
+            elif logCompressionMethod == "lz4":
+                cf = lz4frame.open(compressed, 'wb')
             bufsize = 1024*1024
             while True:
                 buf = infile.read(bufsize)
@@ -613,6 +650,8 @@ class LogFile:
         def _renameCompressedLog(rv):
             if logCompressionMethod == "bz2":
                 filename = self.getFilename() + '.bz2'
+            elif logCompressionMethod == "lz4":
+                filename = self.getFilename() + '.lz4'
             else:
                 filename = self.getFilename() + '.gz'
             if runtime.platformType  == 'win32':
@@ -1,7 +1,7 @@
 from buildbot.process.buildstep import LoggingBuildStep, SUCCESS, SKIPPED
 from twisted.internet import defer
+from collections import OrderedDict
 from buildbot.steps.shell import ShellCommand
-import re
 from buildbot.util import epoch2datetime
 from buildbot.util import safeTranslate
 from buildbot.process.slavebuilder import IDLE, BUILDING
@@ -18,26 +18,63 @@ def mkdt(epoch):
     if epoch:
         return epoch2datetime(epoch)
 
-def getBuildSourceStamps(build, build_sourcestamps):
-    # every build will generate at least one sourcestamp
-    sourcestamps = build.build_status.getSourceStamps()
-
-    # when running rebuild or passing revision as parameter
-    for ss in sourcestamps:
-        build_sourcestamps.append(
+def getArtifactPath(builddir, brid, submitted_at):
+    # artifacts of requests submitted after the location change are kept in
+    # a directory per builder
+    if submitted_at > ARTIFACT_LOCATION_CHANGE_DATE:
+        return "%s/%s_%s" % (builddir, brid, FormatDatetime(submitted_at))
+    return "%s_%s_%s" % (builddir, brid, FormatDatetime(submitted_at))
+
+def getBuildSourceStamps(build):
+    # the artifact steps of a build all need the same list, so it is only
+    # built once per build; callers must not modify it
+    build_sourcestamps = getattr(build, '_artifact_sourcestamps', None)
+    if build_sourcestamps is None:
+        # every build will generate at least one sourcestamp
+        # when running rebuild or passing revision as parameter
+        build_sourcestamps = build._artifact_sourcestamps = [
             {'b_codebase': ss.codebase, 'b_revision': ss.revision, 'b_branch': ss.branch,
-             'b_sourcestampsetid': ss.sourcestampsetid})
+             'b_sourcestampsetid': ss.sourcestampsetid}
+            for ss in build.build_status.getSourceStamps()]
+    return build_sourcestamps
+
+@defer.inlineCallbacks
+def getPreviousBuildRequest(master, build):
+    # the last successful build request of this builder with the same
+    # sourcestamps; it is looked up once per build and shared by the steps
+    if not hasattr(build, '_artifact_prev_buildrequest'):
+        build._artifact_prev_buildrequest = yield master.db.buildrequests\
+            .getBuildRequestBySourcestamps(buildername=build.builder.config.name,
+                                           sourcestamps=getBuildSourceStamps(build))
+    defer.returnValue(build._artifact_prev_buildrequest)
+
+def sshMultiplexingOptions(controlPersist):
+    # with ControlPersist set, the first ssh to a server leaves a master
+    # connection open for that long, and later ssh/rsync calls from the same
+    # slave reuse it instead of doing a new handshake (not for Windows slaves);
+    # the socket lives in the slave user's ~/.ssh so other local users can
+    # neither share nor pre-create it (%C needs OpenSSH >= 6.7)
+    if not controlPersist:
+        return []
+    return ["-o", "ControlMaster=auto", "-o", "ControlPath=~/.ssh/bb-ssh-%C",
+            "-o", "ControlPersist=%s" % controlPersist]
+
+def updateMergedBuildRequests(master, build):
+    # point the build requests merged into this build at the artifacts of
+    # its first request; a build with a single request has nothing to update
+    if len(build.requests) > 1:
+        return master.db.buildrequests.updateMergedBuildRequest(build.requests)
+    return defer.succeed(None)
+
+def _asBool(value):
+    # properties set from the force form arrive as "true"/"false" strings
+    if isinstance(value, bool):
+        return value
+    return isinstance(value, basestring) and value.lower() == "true"
 
 def forceRebuild(build):
-    force_rebuild = build.getProperty("force_rebuild", False)
-    if type(force_rebuild) != bool:
-        force_rebuild = (force_rebuild.lower() == "true")
-
-    force_chain_rebuild = build.getProperty("force_chain_rebuild", False)
-    if type(force_chain_rebuild) != bool:
-        force_chain_rebuild = (force_chain_rebuild.lower() == "true")
-
-    return force_chain_rebuild or force_rebuild
+    return (_asBool(build.getProperty("force_chain_rebuild", False)) or
+            _asBool(build.getProperty("force_rebuild", False)))
 
 class FindPreviousSuccessfulBuild(ResumeBuild):
     name = "Find Previous Successful Build"
@@ -54,30 +91,30 @@ class FindPreviousSuccessfulBuild(ResumeBuild):
         if self.master is None:
             self.master = self.build.builder.botmaster.parent
 
-        yield getBuildSourceStamps(self.build, self.build_sourcestamps)
+        self.build_sourcestamps = getBuildSourceStamps(self.build)
 
         if forceRebuild(self.build):
             self.step_status.setText(["Skipping previous build check (forcing a rebuild)."])
             # update merged buildrequest to reuse artifact generated by current buildrequest
-            if len(self.build.requests) > 1:
-                yield self.master.db.buildrequests.updateMergedBuildRequest(self.build.requests)
+            yield updateMergedBuildRequests(self.master, self.build)
             self.finished(SKIPPED)
             return
 
-        prevBuildRequest = yield self.master.db.buildrequests\
-            .getBuildRequestBySourcestamps(buildername=self.build.builder.config.name,
-                                           sourcestamps=self.build_sourcestamps)
+        prevBuildRequest, build_list = yield self.master.db.buildrequests\
+            .getBuildRequestAndBuildsBySourcestamps(buildername=self.build.builder.config.name,
+                                                    sourcestamps=self.build_sourcestamps)
+        self.build._artifact_prev_buildrequest = prevBuildRequest
 
         if prevBuildRequest:
-            build_list = yield self.master.db.builds.getBuildsForRequest(prevBuildRequest['brid'])
             # there can be many builds per buildrequest for example (retry) when slave lost connection
             # in this case we will display all the builds related to this build request
-            for build in build_list:
-                build_num = build['number']
-                friendly_name = self.build.builder.builder_status.getFriendlyName()
-                url = yield self.master.status.getURLForBuildRequest(prevBuildRequest['brid'],
-                                                                     self.build.builder.config.name, build_num,
-                                                                     friendly_name, self.build_sourcestamps)
+            friendly_name = self.build.builder.builder_status.getFriendlyName()
+            urls = yield defer.gatherResults([
+                self.master.status.getURLForBuildRequest(prevBuildRequest['brid'],
+                                                         self.build.builder.config.name, build['number'],
+                                                         friendly_name, self.build_sourcestamps)
+                for build in build_list], consumeErrors=True)
+            for url in urls:
                 self.addURL(url['text'], url['path'])
             # we are not building but reusing a previous build
             reuse = yield self.master.db.buildrequests.reusePreviousBuild(self.build.requests, prevBuildRequest['brid'])
@@ -88,8 +125,7 @@ class FindPreviousSuccessfulBuild(ResumeBuild):
             self.build.allStepsDone()
             self.resumeBuild = False
         else:
-            if len(self.build.requests) > 1:
-                yield self.master.db.buildrequests.updateMergedBuildRequest(self.build.requests)
+            yield updateMergedBuildRequests(self.master, self.build)
             self.step_status.setText(["Running build (previous sucessful build not found)."])
 
         self.finished(SUCCESS)
@@ -102,17 +138,24 @@ class CheckArtifactExists(ShellCommandResumeBuild):
     descriptionDone="Searching complete."
 
     def __init__(self, artifact=None, artifactDirectory=None, artifactServer=None, artifactServerDir=None,
-                 artifactServerURL=None, artifactServerPort=None, stopBuild=True, resumeBuild=None, **kwargs):
+                 artifactServerURL=None, artifactServerPort=None, artifactServerControlPersist=None,
+                 stopBuild=True, resumeBuild=None, **kwargs):
         self.master = None
         self.build_sourcestamps = []
         if not isinstance(artifact, list):
             artifact = [artifact]
         self.artifact = artifact
+        # the artifacts, keyed by the name ls prints for them
+        self._artifacts_by_name = OrderedDict()
+        for a in artifact:
+            if a:
+                self._artifacts_by_name.setdefault(a.rstrip("/"), []).append(a)
         self.artifactDirectory = artifactDirectory
         self.artifactServer = artifactServer
         self.artifactServerDir = artifactServerDir
         self.artifactServerURL = artifactServerURL
         self.artifactServerPort = artifactServerPort
+        self.artifactServerControlPersist = artifactServerControlPersist
         self.artifactBuildrequest = None
         self.artifactPath = None
         self.artifactURL = None
@@ -122,26 +165,21 @@ class CheckArtifactExists(ShellCommandResumeBuild):
 
     @defer.inlineCallbacks
     def createSummary(self, log):
-        artifactlist = list(self.artifact)
-        stdio = self.getLog('stdio').readlines()
-        notfoundregex = re.compile(r'Not found!!')
-        for l in stdio:
-            m = notfoundregex.search(l)
-            if m:
-                break
-            if len(artifactlist) == 0:
-                break
-            for a in artifactlist:
-                artifact = a
-                if artifact.endswith("/"):
-                    artifact = artifact[:-1]
-                foundregex = re.compile(r'(%s)' % artifact)
-                m = foundregex.search(l)
-                if (m):
-                    artifactURL = self.artifactServerURL + "/" + self.artifactPath + "/" + a
-                    self.addURL(a, artifactURL)
-                    artifactlist.remove(a)
+        pending = self._artifacts_by_name.copy()
 
+        for l in self.getLog('stdio').iterlines():
+            # printed by the remote command when the artifact directory is missing
+            if 'Not found!!' in l or not pending:
+                break
+            # each name is looked for on its own, so one name being a prefix
+            # of another does not hide the longer one
+            for name in pending.keys():
+                if name in l:
+                    for a in pending.pop(name):
+                        artifactURL = self.artifactServerURL + "/" + self.artifactPath + "/" + a
+                        self.addURL(a, artifactURL)
+
+        artifactlist = [a for artifacts in pending.values() for a in artifacts]
         if len(artifactlist) == 0:
             artifactsfound = self.build.getProperty("artifactsfound", True)
 
@@ -163,55 +201,48 @@ class CheckArtifactExists(ShellCommandResumeBuild):
             self.build.setProperty("artifactsfound", False, "CheckArtifactExists %s" % self.artifact)
             self.descriptionDone = ["Artifact not found on server %s." % self.artifactServerURL]
             # update merged buildrequest to reuse artifact generated by current buildrequest
-            if len(self.build.requests) > 1:
-                yield self.master.db.buildrequests.updateMergedBuildRequest(self.build.requests)
+            yield updateMergedBuildRequests(self.master, self.build)
 
     @defer.inlineCallbacks
     def start(self):
         if self.master is None:
             self.master = self.build.builder.botmaster.parent
 
-        yield getBuildSourceStamps(self.build, self.build_sourcestamps)
+        self.build_sourcestamps = getBuildSourceStamps(self.build)
 
         if forceRebuild(self.build):
             self.step_status.setText(["Skipping artifact check (forcing a rebuild)."])
             # update merged buildrequest to reuse artifact generated by current buildrequest
-            if len(self.build.requests) > 1:
-                yield self.master.db.buildrequests.updateMergedBuildRequest(self.build.requests)
+            yield updateMergedBuildRequests(self.master, self.build)
             self.finished(SKIPPED)
             return
 
-        self.artifactBuildrequest = yield self.master.db.\
-            buildrequests.getBuildRequestBySourcestamps(buildername=self.build.builder.config.name,
-                                                        sourcestamps=self.build_sourcestamps)
+        self.artifactBuildrequest = yield getPreviousBuildRequest(self.master, self.build)
 
         if self.artifactBuildrequest:
             self.step_status.setText(["Artifact has been already generated."])
 
-            if self.artifactBuildrequest["submitted_at"] > ARTIFACT_LOCATION_CHANGE_DATE:
-                self.artifactPath = "%s/%s_%s" % (self.build.builder.config.builddir,
-                                                  self.artifactBuildrequest['brid'],
-                                                  FormatDatetime(self.artifactBuildrequest['submitted_at']))
-            else:
-                self.artifactPath = "%s_%s_%s" % (self.build.builder.config.builddir,
-                                                  self.artifactBuildrequest['brid'],
-                                                  FormatDatetime(self.artifactBuildrequest['submitted_at']))
+            self.artifactPath = getArtifactPath(self.build.builder.config.builddir,
+                                                self.artifactBuildrequest['brid'],
+                                                self.artifactBuildrequest['submitted_at'])
 
             if self.artifactDirectory:
                 self.artifactPath += "/%s" %  self.artifactDirectory
 
-            search_artifact = ""
+            search_artifact = []
             for a in self.artifact:
                 if a.endswith("/"):
                     a = a[:-1]
-                    if "/" in a:
-                        index = a.rfind("/")
+                    index = a.rfind("/")
+                    if index != -1:
                         a = a[:index] + "/*"
-                search_artifact += "; ls %s" % a
+                search_artifact.append("; ls %s" % a)
+            search_artifact = "".join(search_artifact)
 
             command = ["ssh", self.artifactServer]
             if self.artifactServerPort:
                 command += ["-p %s" % self.artifactServerPort]
+            command += sshMultiplexingOptions(self.artifactServerControlPersist)
             command += ["cd %s;" % self.artifactServerDir,
                        "if [ -d %s ]; then echo 'Exists'; else echo 'Not found!!'; fi;" % self.artifactPath,
                        "cd %s" % self.artifactPath, search_artifact, "; ls"]
@@ -220,8 +251,7 @@ class CheckArtifactExists(ShellCommandResumeBuild):
             ShellCommandResumeBuild.start(self)
             return
 
-        if len(self.build.requests) > 1:
-            yield self.master.db.buildrequests.updateMergedBuildRequest(self.build.requests)
+        yield updateMergedBuildRequests(self.master, self.build)
         self.step_status.setText(["Artifact not found."])
         self.finished(SUCCESS)
         return
@@ -234,21 +264,17 @@ class CreateArtifactDirectory(ShellCommand):
     descriptionDone="Remote artifact directory created."
 
     def __init__(self,  artifactDirectory=None, artifactServer=None, artifactServerDir=None, artifactServerPort=None,
-                **kwargs):
+                artifactServerControlPersist=None, **kwargs):
         self.artifactDirectory = artifactDirectory
         self.artifactServer = artifactServer
         self.artifactServerDir = artifactServerDir
         self.artifactServerPort = artifactServerPort
+        self.artifactServerControlPersist = artifactServerControlPersist
         ShellCommand.__init__(self, **kwargs)
 
     def start(self):
         br = self.build.requests[0]
-        if mkdt(br.submittedAt) > ARTIFACT_LOCATION_CHANGE_DATE:
-            artifactPath  = "%s/%s_%s" % (self.build.builder.config.builddir,
-                                          br.id, FormatDatetime(mkdt(br.submittedAt)))
-        else:
-            artifactPath  = "%s_%s_%s" % (self.build.builder.config.builddir,
-                                          br.id, FormatDatetime(mkdt(br.submittedAt)))
+        artifactPath = getArtifactPath(self.build.builder.config.builddir, br.id, mkdt(br.submittedAt))
 
         if (self.artifactDirectory):
             artifactPath += "/%s" % self.artifactDirectory
@@ -257,6 +283,7 @@ class CreateArtifactDirectory(ShellCommand):
         command = ["ssh", self.artifactServer]
         if self.artifactServerPort:
             command += ["-p %s" % self.artifactServerPort]
+        command += sshMultiplexingOptions(self.artifactServerControlPersist)
         command += ["cd %s;" % self.artifactServerDir, "mkdir -p ",
                     artifactPath]
 
@@ -286,11 +313,15 @@ def retryCommandWindowsOSPwShell(command):
     return 'powershell.exe -C for ($i=1; $i -le  5; $i++) { '+ command \
            +'; if ($?) { exit 0 } else { sleep 5} } exit -1'
 
-def rsyncWithRetry(step, origin, destination, port=None):
+def rsyncWithRetry(step, origin, destination, port=None, controlPersist=None):
 
     rsync_command = "rsync -var --progress --partial '%s' '%s'" % (origin, destination)
+    rsh = ["ssh"]
     if port:
-        rsync_command += " --rsh='ssh -p %s'" % port
+        rsh += ["-p %s" % port]
+    rsh += sshMultiplexingOptions(controlPersist)
+    if len(rsh) > 1:
+        rsync_command += " --rsh='%s'" % " ".join(rsh)
     if _isWindowsSlave(step):
         if step.usePowerShell:
             return retryCommandWindowsOSPwShell(rsync_command)
@@ -308,7 +339,8 @@ class UploadArtifact(ShellCommand):
     descriptionDone="Artifact(s) uploaded."
 
     def __init__(self, artifact=None, artifactDirectory=None, artifactServer=None, artifactServerDir=None,
-                 artifactServerURL=None, artifactServerPort=None, usePowerShell=True, **kwargs):
+                 artifactServerURL=None, artifactServerPort=None, artifactServerControlPersist=None,
+                 usePowerShell=True, **kwargs):
         self.artifact=artifact
         self.artifactURL = None
         self.artifactDirectory = artifactDirectory
@@ -316,6 +348,7 @@ class UploadArtifact(ShellCommand):
         self.artifactServerDir = artifactServerDir
         self.artifactServerURL = artifactServerURL
         self.artifactServerPort = artifactServerPort
+        self.artifactServerControlPersist = artifactServerControlPersist
         self.usePowerShell = usePowerShell
         ShellCommand.__init__(self, **kwargs)
 
@@ -324,14 +357,9 @@ class UploadArtifact(ShellCommand):
         br = self.build.requests[0]
 
         # this means that we are merging build requests with this one
-        if len(self.build.requests) > 1:
-            master = self.build.builder.botmaster.parent
-            reuse = yield master.db.buildrequests.updateMergedBuildRequest(self.build.requests)
+        yield updateMergedBuildRequests(self.build.builder.botmaster.parent, self.build)
 
-        if mkdt(br.submittedAt) > ARTIFACT_LOCATION_CHANGE_DATE:
-            artifactPath  = "%s/%s_%s" % (self.build.builder.config.builddir, br.id, FormatDatetime(mkdt(br.submittedAt)))
-        else:
-            artifactPath = "%s_%s_%s" % (self.build.builder.config.builddir, br.id, FormatDatetime(mkdt(br.submittedAt)))
+        artifactPath = getArtifactPath(self.build.builder.config.builddir, br.id, mkdt(br.submittedAt))
 
         artifactServerPath = self.build.getProperty("artifactServerPath", None)
         if artifactServerPath is None:
@@ -342,7 +370,8 @@ class UploadArtifact(ShellCommand):
 
         remotelocation = getRemoteLocation(self.artifactServer, self.artifactServerDir, artifactPath, self.artifact)
 
-        command = rsyncWithRetry(self, self.artifact, remotelocation, self.artifactServerPort)
+        command = rsyncWithRetry(self, self.artifact, remotelocation, self.artifactServerPort,
+                                 self.artifactServerControlPersist)
 
         self.artifactURL = self.artifactServerURL + "/" + artifactPath + "/" + self.artifact
         self.setCommand(command)
@@ -360,13 +389,15 @@ class DownloadArtifact(ShellCommand):
     descriptionDone="Artifact(s) downloaded."
 
     def __init__(self, artifactBuilderName=None, artifact=None, artifactDirectory=None, artifactDestination=None,
-                 artifactServer=None, artifactServerDir=None, artifactServerPort=None, usePowerShell=True, **kwargs):
+                 artifactServer=None, artifactServerDir=None, artifactServerPort=None,
+                 artifactServerControlPersist=None, usePowerShell=True, **kwargs):
         self.artifactBuilderName = artifactBuilderName
         self.artifact = artifact
         self.artifactDirectory = artifactDirectory
         self.artifactServer = artifactServer
         self.artifactServerDir = artifactServerDir
         self.artifactServerPort = artifactServerPort
+        self.artifactServerControlPersist = artifactServerControlPersist
         self.artifactDestination = artifactDestination or artifact
         self.master = None
         self.usePowerShell = usePowerShell
@@ -385,19 +416,15 @@ class DownloadArtifact(ShellCommand):
         triggeredbybrid = self.build.requests[0].id
         br = yield self.master.db.buildrequests.getBuildRequestTriggered(triggeredbybrid, self.artifactBuilderName)
 
-        if br["submitted_at"] > ARTIFACT_LOCATION_CHANGE_DATE:
-            artifactPath  = "%s/%s_%s" % (safeTranslate(self.artifactBuilderName),
-                                          br['brid'], FormatDatetime(br["submitted_at"]))
-        else:
-            artifactPath  = "%s_%s_%s" % (safeTranslate(self.artifactBuilderName),
-                                          br['brid'], FormatDatetime(br["submitted_at"]))
+        artifactPath = getArtifactPath(safeTranslate(self.artifactBuilderName), br['brid'], br['submitted_at'])
 
         if (self.artifactDirectory):
             artifactPath += "/%s" % self.artifactDirectory
 
         remotelocation = getRemoteLocation(self.artifactServer, self.artifactServerDir, artifactPath, self.artifact)
 
-        command = rsyncWithRetry(self, remotelocation, self.artifactDestination, self.artifactServerPort)
+        command = rsyncWithRetry(self, remotelocation, self.artifactDestination, self.artifactServerPort,
+                                 self.artifactServerControlPersist)
 
         self.setCommand(command)
         ShellCommand.start(self)
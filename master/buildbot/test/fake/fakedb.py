@@ -1060,6 +1060,18 @@ class FakeBuildRequestsComponent(FakeDBComponent):
 
         return defer.succeed(rv)
 
+    def getBuildRequestAndBuildsBySourcestamps(self, buildername=None, sourcestamps=None):
+        d = self.getBuildRequestBySourcestamps(buildername=buildername, sourcestamps=sourcestamps)
+
+        def addBuilds(brdict):
+            if not brdict:
+                return None, []
+            d = self.db.builds.getBuildsForRequest(brdict['brid'])
+            d.addCallback(lambda builds: (brdict, builds))
+            return d
+        d.addCallback(addBuilds)
+        return d
+
     def getBuildRequestTriggered(self, triggeredbybrid, buildername):
         rv = None
         for id, br in self.reqs.iteritems():
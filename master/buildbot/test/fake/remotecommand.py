@@ -131,6 +131,9 @@ class FakeLogFile(object):
         io = StringIO(self.stdout)
         return io.readlines()
 
+    def iterlines(self):
+        return iter(self.readlines())
+
     def getText(self):
         return ''.join([ c for str,c in self.chunks
                            if str in (STDOUT, STDERR)])
@@ -69,6 +69,12 @@ class Tests(interfaces.InterfaceTests):
         def readlines(self):
             pass
 
+    def test_signature_iterlines(self):
+        log = self.makeLogFile()
+        @self.assertArgSpecMatches(log.iterlines)
+        def iterlines(self):
+            pass
+
     def test_signature_getText(self):
         log = self.makeLogFile()
         @self.assertArgSpecMatches(log.getText)
@@ -92,6 +98,22 @@ class Tests(interfaces.InterfaceTests):
         self.addLogData(log)
         self.assertIn('some text with', log.readlines()[0])
 
+    def test_iterlines(self):
+        log = self.makeLogFile()
+        self.addLogData(log)
+        self.assertEqual(list(log.iterlines()), log.readlines())
+
+    def test_iterlines_line_across_chunks(self):
+        log = self.makeLogFile()
+        # the stderr chunks keep the stdout text in separate chunks
+        log.addStdout('a' * 10)
+        log.addStderr('hidden')
+        log.addStdout('b' * 10)
+        log.addStderr('hidden')
+        log.addStdout('c\nd\ne\nf')
+        self.assertEqual(list(log.iterlines()),
+                         ['a' * 10 + 'b' * 10 + 'c\n', 'd\n', 'e\n', 'f'])
+
     def test_getText(self):
         log = self.makeLogFile()
         self.addLogData(log)
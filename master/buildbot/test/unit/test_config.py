@@ -17,8 +17,10 @@ from __future__ import with_statement
 
 import re
 import os
+import sys
 import textwrap
 import mock
+from collections import OrderedDict
 import __builtin__
 from zope.interface import implements
 from twisted.trial import unittest
@@ -255,6 +257,16 @@ class MasterConfig(ConfigErrorsMixin, dirs.DirsMixin, unittest.TestCase):
                 self.basedir, self.filename))
         self.assertEqual(len(self.flushLoggedErrors(SyntaxError)), 1)
 
+    def test_loadConfig_sys_exit(self):
+        self.install_config_file("""\
+                import sys
+                sys.exit(1)""")
+        self.assertRaisesConfigError(
+            re.compile("error while parsing.*traceback in logfile"),
+            lambda : config.MasterConfig.loadConfig(
+                self.basedir, self.filename))
+        self.assertEqual(len(self.flushLoggedErrors(SystemExit)), 1)
+
     def test_loadConfig_eval_ConfigError(self):
         self.install_config_file("""\
                 from buildbot import config
@@ -335,6 +347,32 @@ class MasterConfig(ConfigErrorsMixin, dirs.DirsMixin, unittest.TestCase):
         self.failUnless(rv.check_horizons.called)
         self.failUnless(rv.check_slavePortnum.called)
 
+    def test_loadConfig_reuses_compiled_code(self):
+        self.patch_load_helpers()
+        self.patch(config, '_config_code_cache', OrderedDict())
+        self.install_config_file("""\
+                BuildmasterConfig = dict()
+                """)
+        config.MasterConfig.loadConfig(self.basedir, self.filename)
+        code = config._config_code_cache.values()
+        config.MasterConfig.loadConfig(self.basedir, self.filename)
+        # code objects compare by value, so check that it is the same object
+        self.assertEqual(len(config._config_code_cache), 1)
+        self.assertIdentical(config._config_code_cache.values()[0], code[0])
+
+        self.install_config_file("""\
+                BuildmasterConfig = dict(title='x')
+                """)
+        config.MasterConfig.loadConfig(self.basedir, self.filename)
+        self.assertEqual(len(config._config_code_cache), 2)
+
+    def test_loadConfig_runs_every_helper(self):
+        helpers = [ n for n in dir(config.MasterConfig)
+                    if n.startswith('load_') or n.startswith('check_') ]
+        self.assertEqual(sorted(helpers),
+                sorted(config.MasterConfig._loaders +
+                       config.MasterConfig._checkers))
+
     def test_loadConfig_with_local_import(self):
         self.patch_load_helpers()
         self.install_config_file("""\
@@ -346,6 +384,18 @@ class MasterConfig(ConfigErrorsMixin, dirs.DirsMixin, unittest.TestCase):
             self.basedir, self.filename)
         self.assertIsInstance(rv, config.MasterConfig)
 
+    def test_loadConfig_restores_sys_path(self):
+        self.patch_load_helpers()
+        self.install_config_file("""\
+                import os, sys
+                sys.path.append(os.path.join(basedir, 'lib'))
+                sys.path.insert(0, basedir)
+                BuildmasterConfig = dict()
+                """)
+        old_sys_path = sys.path[:]
+        config.MasterConfig.loadConfig(self.basedir, self.filename)
+        self.assertEqual(sys.path, old_sys_path)
+
 
 class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
 
@@ -424,10 +474,21 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
         self.do_test_load_global(dict(logCompressionMethod='gz'),
                                  logCompressionMethod='gz')
 
+    def test_load_global_logCompressionMethod_lz4(self):
+        self.patch(config, 'lz4frame', object())
+        self.do_test_load_global(dict(logCompressionMethod='lz4'),
+                                 logCompressionMethod='lz4')
+
+    def test_load_global_logCompressionMethod_lz4_missing(self):
+        self.patch(config, 'lz4frame', None)
+        self.cfg.load_global(self.filename,
+                dict(logCompressionMethod='lz4'))
+        self.assertConfigError(self.errors, "'lz4' requires the lz4 package")
+
     def test_load_global_logCompressionMethod_invalid(self):
         self.cfg.load_global(self.filename,
                 dict(logCompressionMethod='foo'))
-        self.assertConfigError(self.errors, "must be 'bz2' or 'gz'")
+        self.assertConfigError(self.errors, "must be 'bz2', 'gz' or 'lz4'")
 
     def test_load_global_codebaseGenerator(self):
         func = lambda _: "dummy"
@@ -535,6 +596,12 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
         # check that defaults are still around
         self.assertIn('revision', self.cfg.validation)
 
+    def test_load_validation_does_not_modify_defaults(self):
+        r = re.compile('.*')
+        self.cfg.load_validation(self.filename,
+                dict(validation=dict(branch=r)))
+        self.assertNotEqual(config.MasterConfig().validation['branch'], r)
+
 
     def test_load_db_defaults(self):
         self.cfg.load_db(self.filename, {})
@@ -690,6 +757,17 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
             len(self.flushWarnings([self.cfg.load_builders])),
             1)
 
+    @compat.usesFlushWarnings
+    def test_load_builders_abs_builddirs_single_warning(self):
+        bldrs = [ dict(name=n, factory=factory.BuildFactory(), slavename='x',
+                       builddir=os.path.abspath(n), project='default')
+                  for n in ('x', 'y') ]
+        self.cfg.load_builders(self.filename,
+                dict(builders=bldrs))
+        warnings = self.flushWarnings([self.cfg.load_builders])
+        self.assertEqual(len(warnings), 1)
+        self.assertIn(os.path.abspath('y'), warnings[0]['message'])
+
     def test_load_slaves_defaults(self):
         self.cfg.load_slaves(self.filename, {})
         self.assertResults(slaves=[])
@@ -885,6 +963,15 @@ class MasterConfig_checkers(ConfigErrorsMixin, unittest.TestCase):
         self.cfg.check_schedulers()
         self.assertNoConfigErrors(self.errors)
 
+    def test_check_schedulers_listBuilderNames_called_once(self):
+        self.setup_basic_attrs()
+        sch = self.cfg.schedulers['sch']
+        sch.listBuilderNames = mock.Mock(return_value=[ 'b1', 'b2' ])
+        self.cfg.check_single_master()
+        self.cfg.check_schedulers()
+        self.assertNoConfigErrors(self.errors)
+        self.assertEqual(sch.listBuilderNames.call_count, 1)
+
 
     def test_check_locks_dup_builder_lock(self):
         self.setup_builder_locks(builder_lock='l', dup_builder_lock=True)
@@ -1140,6 +1227,12 @@ class BuilderConfig(ConfigErrorsMixin, unittest.TestCase):
             mergeRequests='mr',
             description='buzz')
 
+    def test_unicode_slavenames(self):
+        cfg = config.BuilderConfig(
+            name='b', slavename=u's1', slavenames=u's2',
+            project="default", factory=self.factory)
+        self.assertEqual(cfg.slavenames, [u's2', u's1'])
+
     def test_no_project(self):
         self.assertRaisesConfigError(
             "builder 'a' has no project",
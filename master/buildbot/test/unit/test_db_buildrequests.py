@@ -852,6 +852,49 @@ class TestBuildsetsConnectorComponent(
         d.addCallback(check)
         return d
 
+    def test_previousSuccessFullBuildRequestAndBuildsFound(self):
+        d = self.buildRequestWithSources()
+        d.addCallback(lambda _ : self.insertTestData([
+                fakedb.Build(id=2, number=2, brid=1, start_time=1418823086, finish_time=1418823090),
+                fakedb.Build(id=1, number=1, brid=1, start_time=1418823086)]))
+
+        sources = [
+                {'b_codebase': '1', 'b_revision': 'a', 'b_sourcestampsetid': 2, 'b_branch': 'master'},
+                {'b_codebase': '2', 'b_revision': 'b', 'b_sourcestampsetid': 2, 'b_branch': 'staging'}
+                ]
+
+        d.addCallback(lambda _ :
+                self.db.buildrequests.getBuildRequestAndBuildsBySourcestamps(buildername='builder',
+                                                                             sourcestamps=sources))
+        def check(rv):
+            brdict, builds = rv
+            self.assertEqual(brdict,
+                    dict(artifactbrid=None, brid=1, buildername="builder", buildsetid=1,
+                        complete=True, complete_at=self.COMPLETE_AT, priority=0,
+                        results=0, submitted_at=self.SUBMITTED_AT
+                        ))
+            self.assertEqual([(b['bid'], b['brid'], b['number']) for b in builds],
+                             [(1, 1, 1), (2, 1, 2)])
+            self.assertEqual(builds[0]['finish_time'], None)
+        d.addCallback(check)
+        return d
+
+    def test_previousSuccessFullBuildRequestAndBuildsNotFound(self):
+        d = self.buildRequestWithSources()
+
+        sources = [
+                {'b_codebase': '1', 'b_revision': 'z', 'b_sourcestampsetid': 2, 'b_branch': 'master'},
+                {'b_codebase': '2', 'b_revision': 'b', 'b_sourcestampsetid': 2, 'b_branch': 'dev'}
+                ]
+
+        d.addCallback(lambda _ :
+                self.db.buildrequests.getBuildRequestAndBuildsBySourcestamps(buildername='builder',
+                                                                             sourcestamps=sources))
+        def check(rv):
+            self.assertEqual(rv, (None, []))
+        d.addCallback(check)
+        return d
+
     def test_updateMergedBuildRequests(self):
         breqs = [fakedb.BuildRequest(id=1, buildsetid=1, buildername="builder"),
                  fakedb.BuildRequest(id=2, buildsetid=2, buildername="builder"),
@@ -129,6 +129,17 @@ class BuildbotEngineStrategy_special_cases(unittest.TestCase):
                 [ "mysql:///dbname?charset=utf8&use_unicode=True", None,
                   exp ])
 
+    def test_mysql_pool_size(self):
+        u = url.make_url("mysql:///dbname?pool_size=3&max_overflow=7")
+        kwargs = dict(basedir='my-base-dir')
+        u, kwargs, max_conns = self.strat.special_case_mysql(u, kwargs)
+        exp = self.mysql_kwargs.copy()
+        exp['pool_size'] = 3
+        exp['max_overflow'] = 7
+        self.assertEqual([ str(u), max_conns, self.filter_kwargs(kwargs) ],
+                [ "mysql:///dbname?charset=utf8&use_unicode=True", None,
+                  exp ])
+
     def test_mysql_good_charset(self):
         u = url.make_url("mysql:///dbname?charset=utf8")
         kwargs = dict(basedir='my-base-dir')
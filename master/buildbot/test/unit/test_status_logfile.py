@@ -25,6 +25,22 @@ from buildbot.status import logfile
 from buildbot.test.util import dirs
 from buildbot import config
 
+# compressible contents for the compressLog tests
+_COMP_PAYLOAD = 'xyz' * 1000
+
+# a non-ascii entry, and how it is stored in the log file
+_SNOWMAN_U = u'\N{SNOWMAN}'
+_SNOWMAN_B = _SNOWMAN_U.encode('utf-8')
+
+class ChunkRecorder(object):
+    "a log watcher that remembers the (channel, text) of each chunk"
+
+    def __init__(self):
+        self.chunks = []
+
+    def logChunk(self, build, step, logfile, channel, text):
+        self.chunks.append((channel, text))
+
 class TestLogFileProducer(unittest.TestCase):
     def make_static_logfile(self, contents):
         "make a fake logfile with the given contents"
@@ -51,10 +67,15 @@ class TestLogFileProducer(unittest.TestCase):
 
 class TestLogFile(unittest.TestCase, dirs.DirsMixin):
 
+    # 'hello, world' added one character at a time
+    HELLO_ENTRIES = tuple((0, c) for c in 'hello, world')
+
     def setUp(self):
         step = self.build_step_status = mock.Mock(name='build_step_status')
         self.basedir = step.build.builder.basedir = os.path.abspath('basedir')
         self.setUpDirs(self.basedir)
+        # where the log and its compressed versions are expected on disk
+        self.stdio = os.path.join(self.basedir, '123-stdio')
         self.logfile = logfile.LogFile(step, 'testlf', '123-stdio')
         self.master = self.logfile.master = mock.Mock()
         self.config = self.logfile.master.config = config.MasterConfig()
@@ -68,26 +89,30 @@ class TestLogFile(unittest.TestCase, dirs.DirsMixin):
         self.tearDownDirs()
 
     def pickle_and_restore(self):
-        pkl = cPickle.dumps(self.logfile)
+        # the same protocol BuildStatus and BuilderStatus are saved with
+        pkl = cPickle.dumps(self.logfile, cPickle.HIGHEST_PROTOCOL)
         self.logfile = cPickle.loads(pkl)
         step = self.build_step_status
         self.logfile.step = step
         self.logfile.master = self.master
         step.build.builder.basedir = self.basedir
 
+    def touch(self, path, contents="hi"):
+        with open(path, "w") as f:
+            f.write(contents)
+
     def delete_logfile(self):
         if self.logfile.openfile:
             try:
                 self.logfile.openfile.close()
             except:
                 pass # oh well, we tried
-        os.unlink(os.path.join('basedir', '123-stdio'))
+        os.unlink(self.stdio)
 
     # tests
 
     def test_getFilename(self):
-        self.assertEqual(self.logfile.getFilename(),
-                os.path.abspath(os.path.join('basedir', '123-stdio')))
+        self.assertEqual(self.logfile.getFilename(), self.stdio)
 
     def test_hasContents_yes(self):
         self.assertTrue(self.logfile.hasContents())
@@ -98,21 +123,18 @@ class TestLogFile(unittest.TestCase, dirs.DirsMixin):
 
     def test_hasContents_gz(self):
         self.delete_logfile()
-        with open(os.path.join(self.basedir, '123-stdio.gz'), "w") as f:
-            f.write("hi")
+        self.touch(self.stdio + '.gz')
         self.assertTrue(self.logfile.hasContents())
 
     def test_hasContents_gz_pickled(self):
         self.delete_logfile()
-        with open(os.path.join(self.basedir, '123-stdio.gz'), "w") as f:
-            f.write("hi")
+        self.touch(self.stdio + '.gz')
         self.pickle_and_restore()
         self.assertTrue(self.logfile.hasContents())
 
     def test_hasContents_bz2(self):
         self.delete_logfile()
-        with open(os.path.join(self.basedir, '123-stdio.bz2'), "w") as f:
-            f.write("hi")
+        self.touch(self.stdio + '.bz2')
         self.assertTrue(self.logfile.hasContents())
 
     def test_getName(self):
@@ -169,7 +191,7 @@ class TestLogFile(unittest.TestCase, dirs.DirsMixin):
         d = self.logfile.compressLog()
         def check(_):
             self.assertTrue(
-                    os.path.exists(os.path.join(self.basedir, '123-stdio.bz2')))
+                    os.path.exists(self.stdio + '.bz2'))
             fp = self.logfile.getFile()
             fp.seek(0, 0)
             self.assertIn('hello, world', fp.read())
@@ -190,8 +212,7 @@ class TestLogFile(unittest.TestCase, dirs.DirsMixin):
 
     def test_addEntry_run(self):
         # test that addEntry is calling merge() correctly
-        return self.do_test_addEntry([ (0, c) for c in 'hello, world' ],
-                                     'h')
+        return self.do_test_addEntry(self.HELLO_ENTRIES, 'h')
 
     def test_addEntry_multichan(self):
         return self.do_test_addEntry([(1, 'x'), (2, 'y'), (1, 'z')],
@@ -203,8 +224,7 @@ class TestLogFile(unittest.TestCase, dirs.DirsMixin):
         self.assertEqual(self.logfile.length, 2)
 
     def test_addEntry_unicode(self):
-        return self.do_test_addEntry([(1, u'\N{SNOWMAN}')],
-                                     '\xe2\x98\x83') # utf-8 encoded
+        return self.do_test_addEntry([(1, _SNOWMAN_U)], _SNOWMAN_B)
 
     def test_addEntry_logMaxSize(self):
         self.config.logMaxSize = 10 # not evenly divisible by chunk size
@@ -270,17 +290,18 @@ class TestLogFile(unittest.TestCase, dirs.DirsMixin):
         watcher = mock.Mock(name='watcher')
         self.logfile.watchers.append(watcher)
         self.do_test_addEntry([(0, 'x')], 'x')
-
+        watcher.logChunk.assert_called_once_with(self.build_step_status.build,
+                self.build_step_status, self.logfile, 0, 'x')
 
     def test_addEntry_watchers_logMaxSize(self):
-        watcher = mock.Mock(name='watcher')
+        watcher = ChunkRecorder()
         self.logfile.watchers.append(watcher)
         self.config.logMaxSize = 10
         self.do_test_addEntry([(0, 'x')] * 15,
                 '64:2\nOutput exceeded 10 bytes, remaining output has been '
                 'truncated\n,')
-        logChunk_chunks = [ tuple(args[0][3:])
-                            for args in watcher.logChunk.call_args_list ]
+        # watchers see all of the output, including the truncated part
+        self.assertEqual(watcher.chunks, [(0, 'x')] * 15)
 
     def test_enable_timestamps(self):
         #
@@ -289,12 +310,15 @@ class TestLogFile(unittest.TestCase, dirs.DirsMixin):
         self.logfile.setTimestampsMode(prepend_timestamps=True)
 
         # patch time function, so that we control the timestamp used
-        strftime_mock = mock.Mock(return_value="12:01:29")
-        self.patch(time, "strftime", strftime_mock)
+        formats = []
+        def strftime(fmt):
+            formats.append(fmt)
+            return "12:01:29"
+        self.patch(time, "strftime", strftime)
 
         self.do_test_addEntry([(0, "new message")], "[12:01:29]   new message")
 
-        strftime_mock.assert_called_once_with("%X")
+        self.assertEqual(formats, ["%X"])
 
     def test_addStdout(self):
         addEntry = mock.Mock()
@@ -315,15 +339,15 @@ class TestLogFile(unittest.TestCase, dirs.DirsMixin):
         addEntry.assert_called_with(2, 'hed')
 
     def do_test_compressLog(self, ext, expect_comp=True):
-        self.logfile.openfile.write('xyz' * 1000)
+        self.logfile.openfile.write(_COMP_PAYLOAD)
         self.logfile.finish()
         d = self.logfile.compressLog()
         def check(_):
             st = os.stat(self.logfile.getFilename() + ext)
             if expect_comp:
-                self.assertTrue(0 < st.st_size < 3000)
+                self.assertTrue(0 < st.st_size < len(_COMP_PAYLOAD))
             else:
-                self.assertTrue(st.st_size == 3000)
+                self.assertEqual(st.st_size, len(_COMP_PAYLOAD))
         d.addCallback(check)
         return d
 
@@ -335,6 +359,18 @@ class TestLogFile(unittest.TestCase, dirs.DirsMixin):
         self.config.logCompressionMethod = 'bz2'
         return self.do_test_compressLog('.bz2')
 
+    def test_compressLog_lz4(self):
+        if not logfile.lz4frame:
+            raise unittest.SkipTest("lz4 not installed")
+        self.config.logCompressionMethod = 'lz4'
+        d = self.do_test_compressLog('.lz4')
+        def check(_):
+            fp = self.logfile.getFile()
+            fp.seek(0, 0)
+            self.assertEqual(fp.read(), _COMP_PAYLOAD)
+        d.addCallback(check)
+        return d
+
     def test_compressLog_none(self):
         self.config.logCompressionMethod = None
         return self.do_test_compressLog('', expect_comp=False)
@@ -70,6 +70,24 @@ class TestArtifactSteps(steps.BuildStepMixin, unittest.TestCase):
         self.expectOutcome(result=SUCCESS, status_text=['Remote artifact directory created.'])
         return self.runStep()
 
+    def test_create_artifact_directory_with_control_persist(self):
+        self.setupStep(artifact.CreateArtifactDirectory(artifactDirectory="mydir",
+                                                        artifactServer='usr@srv.com',
+                                                        artifactServerDir='/home/srv/web/dir',
+                                                        artifactServerControlPersist='60s'))
+        self.expectCommands(
+            ExpectShell(workdir='wkdir', usePTY='slave-config',
+                        command=['ssh', 'usr@srv.com',
+                                 '-o', 'ControlMaster=auto', '-o', 'ControlPath=~/.ssh/bb-ssh-%C',
+                                 '-o', 'ControlPersist=60s',
+                                 'cd /home/srv/web/dir;', 'mkdir -p ',
+                                 'build_1_17_12_2014_13_31_26_+0000/mydir'])
+            + ExpectShell.log('stdio', stdout='')
+            + 0
+        )
+        self.expectOutcome(result=SUCCESS, status_text=['Remote artifact directory created.'])
+        return self.runStep()
+
     def test_upload_artifact(self):
         self.setupStep(artifact.UploadArtifact(artifact="myartifact.py", artifactDirectory="mydir",
                                                artifactServer='usr@srv.com', artifactServerDir='/home/srv/web/dir',
@@ -107,6 +125,27 @@ class TestArtifactSteps(steps.BuildStepMixin, unittest.TestCase):
                             'UploadArtifact')
         return self.runStep()
 
+    def test_upload_artifact_with_port_and_control_persist(self):
+        self.setupStep(artifact.UploadArtifact(artifact="myartifact.py", artifactDirectory="mydir",
+                                               artifactServer='usr@srv.com', artifactServerDir='/home/srv/web/dir',
+                                               artifactServerPort=222, artifactServerControlPersist='60s',
+                                               artifactServerURL="http://srv.com/dir"))
+        self.expectCommands(
+            ExpectShell(workdir='wkdir', usePTY='slave-config',
+                        command='for i in 1 2 3 4 5; do rsync -var --progress --partial ' +
+                                self.local + ' ' + self.remote +
+                                ' --rsh=\'ssh -p 222 -o ControlMaster=auto -o ControlPath=~/.ssh/bb-ssh-%C'
+                                ' -o ControlPersist=60s\'; if [ $? -eq 0 ]; then exit 0; else sleep 5; fi;'
+                                ' done; exit -1')
+            + ExpectShell.log('stdio', stdout='')
+            + 0
+        )
+        self.expectOutcome(result=SUCCESS, status_text=['Artifact(s) uploaded.'])
+        self.expectProperty('artifactServerPath',
+                            'http://srv.com/dir/build_1_17_12_2014_13_31_26_+0000',
+                            'UploadArtifact')
+        return self.runStep()
+
     def test_upload_artifact_Win_DOS(self):
         self.setupStep(artifact.UploadArtifact(artifact="myartifact.py", artifactDirectory="mydir",
                                                artifactServer='usr@srv.com', artifactServerDir='/home/srv/web/dir',
@@ -214,6 +253,28 @@ class TestArtifactSteps(steps.BuildStepMixin, unittest.TestCase):
         self.expectOutcome(result=SUCCESS, status_text=["Downloaded 'B'."])
         return self.runStep()
 
+    def test_download_artifact_with_control_persist(self):
+        fake_trigger = fakedb.BuildRequest(id=2, buildsetid=2, buildername="B", complete=1,
+                                           results=0, triggeredbybrid=1, startbrid=1)
+        self.setupStep(artifact.DownloadArtifact(artifactBuilderName="B", artifact="myartifact.py",
+                                                 artifactDirectory="mydir",
+                                                 artifactServer='usr@srv.com',
+                                                 artifactServerControlPersist='60s',
+                                                 artifactServerDir='/home/srv/web/dir'), [fake_trigger])
+
+        self.expectCommands(
+            ExpectShell(workdir='wkdir', usePTY='slave-config',
+                        command='for i in 1 2 3 4 5; do rsync -var --progress --partial ' +
+                                self.remote_2 + ' ' + self.local +
+                                ' --rsh=\'ssh -o ControlMaster=auto -o ControlPath=~/.ssh/bb-ssh-%C'
+                                ' -o ControlPersist=60s\'; if [ $? -eq 0 ]; then exit 0; else sleep 5; fi;'
+                                ' done; exit -1')
+            + ExpectShell.log('stdio', stdout='')
+            + 0
+        )
+        self.expectOutcome(result=SUCCESS, status_text=["Downloaded 'B'."])
+        return self.runStep()
+
     def test_download_artifact_Win_DOS(self):
         fake_trigger = fakedb.BuildRequest(id=2, buildsetid=2, buildername="B", complete=1,
                                            results=0, triggeredbybrid=1, startbrid=1)
@@ -1,5 +1,6 @@
 
 from twisted.trial import unittest
+from twisted.internet import defer
 from buildbot.status import master
 
 from buildbot.test.util import steps
@@ -141,6 +142,39 @@ class TestFindPreviousSuccessfulBuild(steps.BuildStepMixin, config.ConfigErrorsM
         self.expectOutcome(result=SKIPPED, status_text=['Skipping previous build check (forcing a rebuild).'])
         return self.runStep()
 
+    def test_previous_build_lookup_shared_with_checkartifact(self):
+        # FindPreviousSuccessfulBuild looks the previous build request up once
+        # per build; CheckArtifactExists on the same build must reuse it
+        self.setupStep(artifact.FindPreviousSuccessfulBuild())
+        self.expectOutcome(result=SUCCESS, status_text=['Running build (previous sucessful build not found).'])
+        d = self.runStep()
+
+        def runCheckArtifact(_):
+            build = self.build
+            build_sourcestamps = self.step.build_sourcestamps
+            lookups = []
+
+            def getBuildRequestBySourcestamps(**kwargs):
+                lookups.append(kwargs)
+                return defer.succeed({})
+            self.patch(build.builder.botmaster.parent.db.buildrequests,
+                       'getBuildRequestBySourcestamps', getBuildRequestBySourcestamps)
+
+            self.setupStep(artifact.CheckArtifactExists(artifact="myartifact.py", artifactDirectory="artifact",
+                                            artifactServer='usr@srv.com', artifactServerDir='/home/srv/web/dir',
+                                            artifactServerURL="http://srv.com/dir"))
+            self.step.setBuild(build)
+            self.expectOutcome(result=SUCCESS, status_text=["Artifact not found."])
+            d = self.runStep()
+
+            def check(_):
+                self.assertEqual(lookups, [])
+                self.assertIdentical(self.step.build_sourcestamps, build_sourcestamps)
+            d.addCallback(check)
+            return d
+        d.addCallback(runCheckArtifact)
+        return d
+
     # tests CheckArtifactExists
 
     def test_checkartifact_previous_build_not_found(self):
@@ -248,3 +282,79 @@ class TestFindPreviousSuccessfulBuild(steps.BuildStepMixin, config.ConfigErrorsM
         )
         self.expectOutcome(result=SUCCESS, status_text=['Searching complete.'])
         return self.runStep()
+
+    def test_checkartifact_build_found_with_control_persist(self):
+        self.setupStep(artifact.CheckArtifactExists(artifact="myartifact.py", artifactDirectory="artifact",
+                                        artifactServer='usr@srv.com', artifactServerDir='/home/srv/web/dir',
+                                        artifactServerURL="http://srv.com/dir", artifactServerPort=222,
+                                        artifactServerControlPersist='60s'),
+                       sourcestampsInBuild = [FakeSourceStamp(codebase='c',
+                                                              repository='https://url/project',
+                                                              branch='master',
+                                                              revision=12, sourcestampsetid=2)])
+
+        self.expectCommands(
+            ExpectShell(workdir='wkdir', usePTY='slave-config',
+                        command= ['ssh',
+              'usr@srv.com',
+              '-p 222',
+              '-o', 'ControlMaster=auto', '-o', 'ControlPath=~/.ssh/bb-ssh-%C', '-o', 'ControlPersist=60s',
+              'cd /home/srv/web/dir;',
+              "if [ -d build_1_01_01_1970_00_00_00_+0000/artifact ]; then echo 'Exists'; else echo 'Not found!!'; fi;",
+              'cd build_1_01_01_1970_00_00_00_+0000/artifact',
+              '; ls myartifact.py',
+              '; ls'])
+            + ExpectShell.log('stdio', stdout='myartifact.py')
+            + 0
+        )
+        self.expectOutcome(result=SUCCESS, status_text=['Searching complete.'])
+        return self.runStep()
+
+    def setupCheckArtifactStep(self, artifacts, stdout):
+        self.setupStep(artifact.CheckArtifactExists(artifact=artifacts, artifactDirectory="artifact",
+                                        artifactServer='usr@srv.com', artifactServerDir='/home/srv/web/dir',
+                                        artifactServerURL="http://srv.com/dir"),
+                       sourcestampsInBuild = [FakeSourceStamp(codebase='c',
+                                                              repository='https://url/project',
+                                                              branch='master',
+                                                              revision=12, sourcestampsetid=2)])
+
+        self.expectCommands(
+            ExpectShell(workdir='wkdir', usePTY='slave-config',
+                        command= ['ssh',
+              'usr@srv.com',
+              'cd /home/srv/web/dir;',
+              "if [ -d build_1_01_01_1970_00_00_00_+0000/artifact ]; then echo 'Exists'; else echo 'Not found!!'; fi;",
+              'cd build_1_01_01_1970_00_00_00_+0000/artifact',
+              ''.join('; ls %s' % a.rstrip('/') for a in artifacts),
+              '; ls'])
+            + ExpectShell.log('stdio', stdout=stdout)
+            + 0
+        )
+
+    def test_checkartifact_build_found_artifacts_with_common_prefix(self):
+        self.setupCheckArtifactStep(['foo', 'foobar'], stdout='foobar\nfoo\n')
+        self.expectOutcome(result=SUCCESS, status_text=['Searching complete.'])
+        self.expectURLS({'foo': 'http://srv.com/dir/build_1_01_01_1970_00_00_00_+0000/artifact/foo',
+                         'foobar': 'http://srv.com/dir/build_1_01_01_1970_00_00_00_+0000/artifact/foobar'})
+        return self.runStep()
+
+    def test_checkartifact_build_found_artifacts_one_missing(self):
+        self.setupCheckArtifactStep(['foobar', 'foo.zip'], stdout='foobar\n')
+        self.expectOutcome(result=SUCCESS, status_text=['Artifact not found on server http://srv.com/dir.'])
+        self.expectURLS({'foobar': 'http://srv.com/dir/build_1_01_01_1970_00_00_00_+0000/artifact/foobar'})
+        return self.runStep()
+
+    def test_checkartifact_build_found_artifact_name_is_literal(self):
+        # a '.' in the name only matches a dot, and '+' is not a quantifier
+        self.setupCheckArtifactStep(['lib.so', 'c++.zip'], stdout='libxso\nc++.zip\n')
+        self.expectOutcome(result=SUCCESS, status_text=['Artifact not found on server http://srv.com/dir.'])
+        self.expectURLS({'c++.zip': 'http://srv.com/dir/build_1_01_01_1970_00_00_00_+0000/artifact/c++.zip'})
+        return self.runStep()
+
+    def test_checkartifact_build_found_duplicate_directory_artifacts(self):
+        self.setupCheckArtifactStep(['dir', 'dir/'], stdout='dir\n')
+        self.expectOutcome(result=SUCCESS, status_text=['Searching complete.'])
+        self.expectURLS({'dir': 'http://srv.com/dir/build_1_01_01_1970_00_00_00_+0000/artifact/dir',
+                         'dir/': 'http://srv.com/dir/build_1_01_01_1970_00_00_00_+0000/artifact/dir/'})
+        return self.runStep()